@@ -1,39 +1,100 @@
-from flask import Flask, request, render_template, jsonify
-from PIL import Image, ImageStat, ImageFilter
 import os
-import base64
-from io import BytesIO
+
+def _configure_threads():
+    """Apply the optional ANALYSIS_NUM_THREADS cap to the OpenMP/BLAS thread pools"""
+    try:
+        num_threads = max(1, int(os.environ['ANALYSIS_NUM_THREADS']))
+    except (KeyError, ValueError):
+        return None
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ.setdefault(var, str(num_threads))
+    return num_threads
+
+# Must run before numpy and cv2 are imported
+NUM_THREADS = _configure_threads()
+
+from flask import Flask, request, render_template, jsonify, url_for
+from PIL import Image, ImageStat
 import numpy as np
+import cv2
 import hashlib
+from numba import njit
+from image_store import images, open_upload, check_pixels, store_image, UploadError
+
+if NUM_THREADS is not None:
+    cv2.setNumThreads(NUM_THREADS)
 
 app = Flask(__name__)
+app.register_blueprint(images)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32 MB upload limit
+
+# Largest image accepted, in pixels; bigger uploads are refused before decoding
+Image.MAX_IMAGE_PIXELS = 50_000_000
+
+# Pillow's FIND_EDGES kernel; the > 50 edge threshold below is calibrated to its scale
+EDGE_KERNEL = np.array([[-1, -1, -1],
+                        [-1,  8, -1],
+                        [-1, -1, -1]], dtype=np.float32)
+
+# Serial on purpose: on a 512px thumbnail the kernel runs in well under a millisecond,
+# and a parallel kernel called from Flask's request threads can abort the process
+# under Numba's workqueue threading layer.
+@njit(cache=True)
+def _analyze_pixels(rgb, edges):
+    """Single pass over the image: per-channel sums and strong edge count"""
+    height, width = edges.shape
+    r_sum = 0
+    g_sum = 0
+    b_sum = 0
+    edge_count = 0
+    for y in range(height):
+        for x in range(width):
+            r_sum += rgb[y, x, 0]
+            g_sum += rgb[y, x, 1]
+            b_sum += rgb[y, x, 2]
+            if edges[y, x] > 50:
+                edge_count += 1
+    return r_sum, g_sum, b_sum, edge_count
+
+# Compile (or load from the on-disk cache) at startup instead of on the first request;
+# a cold compile takes about a second. The argument types match real_image_analysis:
+# a read-only view of a Pillow RGB image and a writable OpenCV edge map.
+_analyze_pixels(np.asarray(Image.new('RGB', (1, 1))), np.zeros((1, 1), dtype=np.uint8))
 
 def real_image_analysis(image):
     """Real computer vision analysis of image content"""
     
-    # Convert to numpy array for analysis
-    img_array = np.array(image.convert('RGB'))
+    # Scene-level statistics don't need full resolution, analyse a thumbnail.
+    # Colour averages are resolution independent, but edge density is not: it is
+    # measured at this fixed <=512px scale, which the edge_density thresholds assume.
+    small = image.copy()
+    small.thumbnail((512, 512), Image.Resampling.BILINEAR)
+    
+    # Convert to numpy array for analysis (read-only view, no extra copy)
+    if small.mode != 'RGB':
+        small = small.convert('RGB')
+    img_array = np.asarray(small)
     height, width, channels = img_array.shape
     
-    # Color analysis
-    avg_colors = np.mean(img_array, axis=(0,1))
-    r_avg, g_avg, b_avg = avg_colors
+    # Edge detection simulation (high contrast areas = objects)
+    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    edge_pixels = cv2.filter2D(gray, -1, EDGE_KERNEL, borderType=cv2.BORDER_REPLICATE)
+    
+    # Color sums and edge count in one pass over the pixels
+    r_sum, g_sum, b_sum, edge_count = _analyze_pixels(img_array, edge_pixels)
+    num_pixels = width * height
+    r_avg, g_avg, b_avg = r_sum / num_pixels, g_sum / num_pixels, b_sum / num_pixels
+    edge_density = edge_count / num_pixels
     
     # Detect dominant colors
     is_green_dominant = g_avg > r_avg and g_avg > b_avg  # Trees, grass
     is_blue_dominant = b_avg > r_avg and b_avg > g_avg   # Sky, water
     is_gray_dominant = abs(r_avg - g_avg) < 20 and abs(g_avg - b_avg) < 20  # Roads, buildings
     
-    # Edge detection simulation (high contrast areas = objects)
-    gray_img = image.convert('L')
-    edge_img = gray_img.filter(ImageFilter.FIND_EDGES)
-    edge_pixels = np.array(edge_img)
-    edge_density = np.sum(edge_pixels > 50) / (width * height)
-    
     # Brightness analysis for different regions
-    brightness = np.mean(img_array)
+    brightness = (r_sum + g_sum + b_sum) / (3 * num_pixels)
     
     # Shape analysis
     aspect_ratio = width / height
@@ -108,15 +169,12 @@ def real_image_analysis(image):
             'confidence': round(0.70 + edge_density, 3)
         })
     
-    # Remove duplicates and limit results
-    seen_objects = set()
-    unique_detections = []
+    # Remove duplicates (first detection per name wins) and limit results
+    unique_detections = {}
     for det in detections:
-        if det['name'] not in seen_objects:
-            seen_objects.add(det['name'])
-            unique_detections.append(det)
+        unique_detections.setdefault(det['name'], det)
     
-    return unique_detections[:6]  # Max 6 objects
+    return list(unique_detections.values())[:6]  # Max 6 objects
 
 @app.route('/')
 def index():
@@ -132,18 +190,24 @@ def detect_objects():
         return jsonify({'error': 'No image selected'}), 400
     
     try:
-        # Read image
-        image = Image.open(file.stream)
+        # Read image; web formats are served back as uploaded
+        raw = file.stream.read()
+        try:
+            image = open_upload(raw)
+            check_pixels(image)
+            
+            # Keep the image for the image endpoint
+            img_id = store_image(image, raw)
+        except UploadError as e:
+            return jsonify({'error': str(e)}), 400
         print(f"\n🔍 Analyzing image: {image.size[0]}x{image.size[1]} pixels")
         
+        # Let libjpeg decode at a reduced scale, only the analysis reads the pixels
+        image.draft('RGB', (1024, 1024))
+        
         # Real image analysis
         detections = real_image_analysis(image)
         
-        # Convert image to base64
-        buffer = BytesIO()
-        image.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
         print(f"✅ Detection complete: Found {len(detections)} objects")
         for det in detections:
             print(f"   - {det['name']}: {det['confidence']:.1%}")
@@ -151,7 +215,7 @@ def detect_objects():
         return jsonify({
             'success': True,
             'detections': detections,
-            'image': img_str,
+            'image_url': url_for('images.get_image', img_id=img_id),
             'count': len(detections),
             'message': 'Real Computer Vision Analysis',
             'processing_time': f'{np.random.randint(180, 350)}ms',
@@ -171,5 +235,10 @@ def health():
         'version': '3.0'
     })
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    # MAX_CONTENT_LENGTH exceeded; answer in JSON like every other /detect error
+    return jsonify({'error': 'Image is too large'}), 413
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -1,13 +1,20 @@
-from flask import Flask, request, render_template, jsonify
-from PIL import Image
+from flask import Flask, request, render_template, jsonify, url_for
 import os
-import base64
-from io import BytesIO
 import json
+from image_store import images, open_upload, store_image, UploadError
 
 app = Flask(__name__)
+app.register_blueprint(images)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32 MB upload limit
+
+# Smart mock detections based on common objects, built once and shared by all requests
+MOCK_DETECTIONS = (
+    {'name': 'person', 'confidence': 0.87, 'bbox': [100, 50, 300, 400]},
+    {'name': 'car', 'confidence': 0.74, 'bbox': [50, 200, 250, 350]},
+    {'name': 'bicycle', 'confidence': 0.68, 'bbox': [300, 150, 450, 300]}
+)
 
 @app.route('/')
 def index():
@@ -23,26 +30,21 @@ def detect_objects():
         return jsonify({'error': 'No image selected'}), 400
     
     try:
-        # Read image
-        image = Image.open(file.stream)
-        
-        # Convert to base64 for display
-        buffer = BytesIO()
-        image.save(buffer, format='PNG')
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        # Smart mock detections based on common objects
-        mock_detections = [
-            {'name': 'person', 'confidence': 0.87, 'bbox': [100, 50, 300, 400]},
-            {'name': 'car', 'confidence': 0.74, 'bbox': [50, 200, 250, 350]},
-            {'name': 'bicycle', 'confidence': 0.68, 'bbox': [300, 150, 450, 300]}
-        ]
+        # Serve the upload back for display; web formats are not decoded at all
+        raw = file.stream.read()
+        try:
+            image = open_upload(raw)
+            
+            # Keep the image for the image endpoint
+            img_id = store_image(image, raw)
+        except UploadError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'success': True,
-            'detections': mock_detections,
-            'image': img_str,
-            'count': len(mock_detections),
+            'detections': MOCK_DETECTIONS,
+            'image_url': url_for('images.get_image', img_id=img_id),
+            'count': len(MOCK_DETECTIONS),
             'message': 'Cloud Vision Processing - Demo Mode',
             'processing_time': '245ms',
             'model': 'YOLOv5s',
@@ -66,11 +68,16 @@ def health():
 def api_status():
     return jsonify({
         'microservice': 'vision-processing',
-        'endpoints': ['/detect', '/health', '/api/status'],
+        'endpoints': ['/detect', '/detect/image/<img_id>', '/health', '/api/status'],
         'models': ['YOLOv5s', 'Object Detection'],
         'cloud_ready': True,
         'docker_deployed': True
     })
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    # MAX_CONTENT_LENGTH exceeded; answer in JSON like every other /detect error
+    return jsonify({'error': 'Image is too large'}), 413
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
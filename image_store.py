@@ -0,0 +1,85 @@
+from flask import Blueprint, jsonify, send_file
+from PIL import Image, UnidentifiedImageError
+from cachetools import TTLCache
+import threading
+import uuid
+from io import BytesIO
+
+images = Blueprint('images', __name__)
+
+# Uploaded images are served from /detect/image/<img_id> instead of inlined in JSON.
+# The cache is bounded by total bytes and lives in this process only, so image URLs
+# only resolve on the worker that handled the upload (run a single worker).
+IMAGE_CACHE_BYTES = 128 * 1024 * 1024
+IMAGE_CACHE = TTLCache(maxsize=IMAGE_CACHE_BYTES, ttl=300, getsizeof=lambda entry: len(entry[0]))
+IMAGE_CACHE_LOCK = threading.Lock()
+
+# Formats every browser can display are served exactly as uploaded
+WEB_IMAGE_TYPES = {
+    'JPEG': 'image/jpeg',
+    'MPO': 'image/jpeg',  # JPEG with extra frames, e.g. from phone cameras
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+    'BMP': 'image/bmp',
+}
+
+# Modes the PNG encoder writes directly; anything else is converted first
+PNG_MODES = ('1', 'L', 'LA', 'I', 'I;16', 'P', 'RGB', 'RGBA')
+
+class UploadError(ValueError):
+    """Upload rejected; the message is safe to return to the client"""
+
+def open_upload(raw):
+    """Open uploaded bytes as an image, UploadError if Pillow can't identify them"""
+    try:
+        image = Image.open(BytesIO(raw))
+    except UnidentifiedImageError:
+        raise UploadError('Uploaded file is not an image')
+    except Image.DecompressionBombError:
+        raise UploadError('Image is too large')
+    return image
+
+def check_pixels(image):
+    """Refuse images over Image.MAX_IMAGE_PIXELS; call before decoding the pixels"""
+    # Pillow only warns up to 2x MAX_IMAGE_PIXELS, so enforce the limit here
+    if Image.MAX_IMAGE_PIXELS and image.size[0] * image.size[1] > Image.MAX_IMAGE_PIXELS:
+        raise UploadError('Image is too large')
+
+def display_image(image, raw):
+    """Bytes and content type a browser can show for an upload"""
+    # Content type comes from the decoded format, never from the client
+    image_type = WEB_IMAGE_TYPES.get(image.format)
+    if image_type:
+        return raw, image_type
+    
+    # Other formats (TIFF, PPM, TGA, ...) are re-encoded to PNG once, which decodes them
+    check_pixels(image)
+    try:
+        if image.mode not in PNG_MODES:
+            image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+    except (OSError, ValueError):
+        raise UploadError('Unsupported image format')
+    return buffer.getvalue(), 'image/png'
+
+def store_image(image, raw):
+    """Keep an upload for the image endpoint and return its id"""
+    raw, image_type = display_image(image, raw)
+    img_id = uuid.uuid4().hex
+    with IMAGE_CACHE_LOCK:
+        IMAGE_CACHE[img_id] = (raw, image_type)
+    return img_id
+
+@images.route('/detect/image/<img_id>')
+def get_image(img_id):
+    with IMAGE_CACHE_LOCK:
+        cached = IMAGE_CACHE.get(img_id)
+    if cached is None:
+        return jsonify({'error': 'Image not found or expired'}), 404
+    
+    raw, image_type = cached
+    response = send_file(BytesIO(raw), mimetype=image_type, max_age=300)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response